@@ -1,59 +1,188 @@
 import re
+import json
+import functools
+import operator
+import asyncio
+import random
+import time
 import pandas as pd
-from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import logging
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+_WS_RE = re.compile(r'\s+')
+_SPECIAL_RE = re.compile(r'[^\w\s\.\,\!\?\-\:\;\(\)\[\]\{\}\"\'\/\@\#\$\%\^\&\*\+\=\~\`]')
+_WORD_RE = re.compile(r'\b[a-zA-Zа-яА-Я]{3,}\b')
+# Все, что изменил бы clean_text: пробельные символы кроме одиночного пробела, пробелы по краям и спецсимволы
+_DIRTY_RE = re.compile(r'[^\S ]| {2,}|^ | $|' + _SPECIAL_RE.pattern)
+
+_NUMBERING_RE = re.compile(r'^\s*\d+[\).\s]+')
+
+_SENTIMENTS = ("Позитивная", "Негативная", "Нейтральная")
+
+# Лимиты и временные сбои OpenAI: SDK их не повторяет (max_retries=0), поэтому повторяем сами с той же задержкой
+_SENTIMENT_RETRY_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+_RESET_PART_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_RESET_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+_SENTIMENT_MAX_ATTEMPTS = 5
+
+_BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+_STOP_WORDS = frozenset({'это', 'как', 'что', 'когда', 'где', 'почему', 'который', 'для', 'с', 'на', 'и', 'в', 'не', 'по', 'к', 'у', 'от', 'до', 'о', 'об', 'при', 'за', 'так', 'же', 'быть', 'был', 'была', 'было', 'будет', 'есть', 'are', 'the', 'is', 'at', 'which', 'on', 'and', 'or', 'but', 'in', 'with', 'to', 'for', 'of', 'as', 'by', 'that', 'this', 'it', 'from'})
+
+_CATEGORIES = {
+    "Продажи/Реклама": ["купить", "продать", "цена", "скидка", "акция", "предложение", "buy", "sell", "price", "discount"],
+    "Вопросы": ["?", "как", "почему", "когда", "где", "что", "кто", "why", "when", "where", "what", "who"],
+    "Информация/Новости": ["новость", "информация", "обновление", "важно", "news", "information", "update", "important"],
+    "Общение/Чат": ["привет", "здравствуйте", "спасибо", "пока", "hello", "hi", "thanks", "bye"],
+    "Ссылки/Медиа": ["http", "www", ".com", ".ru", "ссылка", "link", "video", "photo"],
+    "Работа/Бизнес": ["работа", "проект", "задача", "дедлайн", "work", "project", "task", "deadline"],
+    "Другое": []
+}
+
+# Одно регулярное выражение на категорию вместо перебора ключевых слов; порядок задает приоритет
+_CATEGORY_RES = [
+    (category, re.compile('|'.join(re.escape(keyword) for keyword in keywords), re.IGNORECASE))
+    for category, keywords in _CATEGORIES.items()
+    if keywords
+]
+
+
+def _build_category_automaton():
+    """Строит автомат Ахо-Корасик по всем ключевым словам категорий"""
+    automaton = ahocorasick.Automaton()
+    for priority, (category, keywords) in enumerate(_CATEGORIES.items()):
+        for keyword in keywords:
+            # Ключевое слово остается за категорией с наивысшим приоритетом
+            if keyword not in automaton:
+                automaton.add_word(keyword, (priority, category))
+    automaton.make_automaton()
+    return automaton
+
+
+_CATEGORY_AUTOMATON = _build_category_automaton() if ahocorasick else None
+
+
+# Результаты кэшируются по тексту: в группах много повторов ("ок", "+1", пересланные сообщения)
+@functools.lru_cache(maxsize=4096)
+def _extract_keywords(text: str) -> Tuple[str, ...]:
+    """Извлекает ключевые слова из текста"""
+    # Простое извлечение ключевых слов
+    words = _WORD_RE.findall(text.lower())
+    
+    # Фильтруем стоп-слова
+    keywords = [word for word in words if word not in _STOP_WORDS]
+    
+    return tuple(dict.fromkeys(keywords[:10]))  # Возвращаем уникальные ключевые слова
+
+
+@functools.lru_cache(maxsize=4096)
+def _categorize(text: str) -> str:
+    """Категоризирует сообщение по содержанию"""
+    if _CATEGORY_AUTOMATON is not None:
+        # Один проход по тексту находит все ключевые слова сразу; побеждает категория с наивысшим приоритетом
+        best = min((match for _, match in _CATEGORY_AUTOMATON.iter(text.lower())), default=None)
+        return best[1] if best else "Другое"
+    
+    for category, pattern in _CATEGORY_RES:
+        if pattern.search(text):
+            return category
+            
+    return "Другое"
+
+
+# Поля сообщений WhatsAppClient (атрибуты Message), которые попадают в таблицу
+_SOURCE_COLUMNS = ("message_id", "author", "text", "timestamp", "type")
+_source_fields = operator.attrgetter(*_SOURCE_COLUMNS)
+
+
+def _parse_reset(value: Optional[str]) -> float:
+    """Переводит время сброса лимита OpenAI вида '6m0s' или '120ms' в секунды"""
+    if not value:
+        return 0.0
+    return sum(float(amount) * _RESET_UNITS[unit] for amount, unit in _RESET_PART_RE.findall(value))
+
+
+class _RateLimitBudget:
+    """Остаток минутных лимитов OpenAI по заголовкам x-ratelimit-*: запросы притормаживаются заранее, а не после 429"""
+
+    def __init__(self):
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.reset_at = 0.0
+
+    def update(self, headers) -> None:
+        requests_left = headers.get("x-ratelimit-remaining-requests")
+        tokens_left = headers.get("x-ratelimit-remaining-tokens")
+        if requests_left is not None:
+            self.remaining_requests = int(requests_left)
+        if tokens_left is not None:
+            self.remaining_tokens = int(tokens_left)
+        reset = max(_parse_reset(headers.get("x-ratelimit-reset-requests")), _parse_reset(headers.get("x-ratelimit-reset-tokens")))
+        self.reset_at = time.monotonic() + reset
+
+    async def acquire(self, tokens: int) -> None:
+        while self._exhausted(tokens):
+            delay = self.reset_at - time.monotonic()
+            if delay <= 0:
+                # Окно лимита обновилось - актуальные остатки придут в заголовках следующего ответа
+                self.remaining_requests = self.remaining_tokens = None
+                break
+            await asyncio.sleep(delay)
+            
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= tokens
+
+    def _exhausted(self, tokens: int) -> bool:
+        return ((self.remaining_requests is not None and self.remaining_requests < 1) or
+                (self.remaining_tokens is not None and self.remaining_tokens < tokens))
 
 class DataProcessor:
-    def __init__(self, openai_api_key: Optional[str] = None):
-        self.openai_client = OpenAI(api_key=openai_api_key) if openai_api_key else None
+    def __init__(self, openai_api_key: Optional[str] = None, openai_batch_mode: bool = False):
+        self._openai_api_key = openai_api_key
+        # Фоновый режим: тональность считается через OpenAI Batch API (дешевле, но результат может ждать до 24 часов)
+        self.openai_batch_mode = openai_batch_mode
         self.logger = logging.getLogger(__name__)
 
+    @functools.cached_property
+    def openai_client(self) -> Optional[OpenAI]:
+        """Клиент OpenAI создается при первом обращении, чтобы запуски без анализа тональности его не инициализировали"""
+        return OpenAI(api_key=self._openai_api_key) if self._openai_api_key else None
+
     def clean_text(self, text: str) -> str:
         """Очищает текст от лишних символов и форматирования"""
         if not text:
             return ""
             
+        # Уже чистый текст возвращаем как есть, без двух проходов замены
+        if not _DIRTY_RE.search(text):
+            return text
+            
         # Удаляем лишние пробелы и переносы строк
-        text = re.sub(r'\s+', ' ', text.strip())
+        text = _WS_RE.sub(' ', text.strip())
         
-        # Удаляем специальные символы WhatsApp
-        text = re.sub(r'[^\w\s\.\,\!\?\-\:\;\(\)\[\]\{\}\"\'\/\@\#\$\%\^\&\*\+\=\~\`]', '', text)
+        # Удаляем специальные символы WhatsApp. Регулярное выражение здесь быстрее str.translate:
+        # translate делает поиск в словаре на каждый символ, а класс символов проверяется внутри движка re
+        text = _SPECIAL_RE.sub('', text)
         
         return text
 
-    def extract_keywords(self, text: str) -> List[str]:
+    def extract_keywords(self, text: str) -> Tuple[str, ...]:
         """Извлекает ключевые слова из текста"""
-        # Простое извлечение ключевых слов
-        words = re.findall(r'\b[a-zA-Zа-яА-Я]{3,}\b', text.lower())
-        
-        # Фильтруем стоп-слова
-        stop_words = {'это', 'как', 'что', 'когда', 'где', 'почему', 'который', 'для', 'с', 'на', 'и', 'в', 'не', 'по', 'к', 'у', 'от', 'до', 'о', 'об', 'при', 'за', 'так', 'же', 'быть', 'был', 'была', 'было', 'будет', 'есть', 'are', 'the', 'is', 'at', 'which', 'on', 'and', 'or', 'but', 'in', 'with', 'to', 'for', 'of', 'as', 'by', 'that', 'this', 'it', 'from'}
-        
-        keywords = [word for word in words if word not in stop_words and len(word) > 2]
-        
-        return list(set(keywords[:10]))  # Возвращаем уникальные ключевые слова
+        return _extract_keywords(text)
 
     def categorize_message(self, text: str) -> str:
         """Категоризирует сообщение по содержанию"""
-        text_lower = text.lower()
-        
-        categories = {
-            "Продажи/Реклама": ["купить", "продать", "цена", "скидка", "акция", "предложение", "buy", "sell", "price", "discount"],
-            "Вопросы": ["?", "как", "почему", "когда", "где", "что", "кто", "why", "when", "where", "what", "who"],
-            "Информация/Новости": ["новость", "информация", "обновление", "важно", "news", "information", "update", "important"],
-            "Общение/Чат": ["привет", "здравствуйте", "спасибо", "пока", "hello", "hi", "thanks", "bye"],
-            "Ссылки/Медиа": ["http", "www", ".com", ".ru", "ссылка", "link", "video", "photo"],
-            "Работа/Бизнес": ["работа", "проект", "задача", "дедлайн", "work", "project", "task", "deadline"],
-            "Другое": []
-        }
-        
-        for category, keywords in categories.items():
-            if any(keyword in text_lower for keyword in keywords):
-                return category
-                
-        return "Другое"
+        return _categorize(text)
 
     def analyze_sentiment(self, text: str) -> str:
         """Анализирует тональность сообщения"""
@@ -61,56 +190,260 @@ class DataProcessor:
             return "Не определено"
             
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Определи тональность сообщения как 'Позитивная', 'Негативная' или 'Нейтральная'. Ответь только одним словом."},
-                    {"role": "user", "content": text}
-                ],
-                max_tokens=10,
-                temperature=0
-            )
+            response = self.openai_client.chat.completions.create(**self._sentiment_request(text))
             
             sentiment = response.choices[0].message.content.strip()
-            return sentiment if sentiment in ["Позитивная", "Негативная", "Нейтральная"] else "Нейтральная"
+            return sentiment if sentiment in _SENTIMENTS else "Нейтральная"
             
         except Exception as e:
             self.logger.error(f"Ошибка при анализе тональности: {str(e)}")
             return "Не определено"
 
-    def process_messages(self, messages: List[Dict]) -> pd.DataFrame:
-        """Обрабатывает список сообщений и возвращает DataFrame"""
-        processed_data = []
+    def _sentiment_request(self, text: str) -> Dict:
+        """Формирует параметры запроса к OpenAI для одного сообщения"""
+        return {
+            "model": "gpt-3.5-turbo",
+            "messages": [
+                {"role": "system", "content": "Определи тональность сообщения как 'Позитивная', 'Негативная' или 'Нейтральная'. Ответь только одним словом."},
+                {"role": "user", "content": text}
+            ],
+            "max_tokens": 10,
+            "temperature": 0
+        }
+
+    def analyze_sentiments_batch(self, texts: List[str], batch_size: int = 20) -> List[str]:
+        """Анализирует тональность списка сообщений, отправляя по batch_size сообщений в одном запросе"""
+        if not self.openai_client:
+            return ["Не определено"] * len(texts)
+            
+        sentiments = []
+        for start in range(0, len(texts), batch_size):
+            sentiments.extend(self._analyze_sentiment_chunk(texts[start:start + batch_size]))
+            
+        return sentiments
+
+    def _analyze_sentiment_chunk(self, texts: List[str]) -> List[str]:
+        """Определяет тональность нескольких сообщений одним запросом к OpenAI"""
+        try:
+            response = self.openai_client.chat.completions.create(**self._sentiment_chunk_request(texts))
+            labels = self._parse_sentiment_labels(response.choices[0].message.content)
+            
+        except Exception as e:
+            self.logger.error(f"Ошибка при пакетном анализе тональности: {str(e)}")
+            return ["Не определено"] * len(texts)
+            
+        return self._match_sentiment_labels(texts, labels)
+
+    def analyze_sentiments_parallel(self, texts: List[str], batch_size: int = 20, concurrency: int = 8) -> List[str]:
+        """Анализирует тональность пакетами, отправляя до concurrency запросов к OpenAI одновременно"""
+        if not self._openai_api_key:
+            return ["Не определено"] * len(texts)
+            
+        return asyncio.run(self._sentiment_async(texts, batch_size, concurrency))
+
+    async def _sentiment_async(self, texts: List[str], batch_size: int, concurrency: int) -> List[str]:
+        """Параллельно обрабатывает пакеты сообщений в пределах лимитов OpenAI"""
+        # Повторы выполняем сами, чтобы учитывать лимиты из заголовков
+        client = AsyncOpenAI(api_key=self._openai_api_key, max_retries=0)
+        semaphore = asyncio.Semaphore(concurrency)
+        budget = _RateLimitBudget()
         
-        for message in messages:
-            text = message.get("text", "")
-            cleaned_text = self.clean_text(text)
-            
-            processed_message = {
-                "ID сообщения": message.get("message_id"),
-                "Автор": message.get("author"),
-                "Текст сообщения": cleaned_text,
-                "Оригинальный текст": text,
-                "Время": message.get("timestamp"),
-                "Тип сообщения": message.get("type"),
-                "Категория": self.categorize_message(cleaned_text),
-                "Ключевые слова": ", ".join(self.extract_keywords(cleaned_text)),
-                "Тональность": self.analyze_sentiment(cleaned_text),
-                "Длина сообщения": len(cleaned_text),
-                "Дата": datetime.fromisoformat(message.get("timestamp", datetime.now().isoformat())).strftime("%Y-%m-%d"),
-                "Время суток": datetime.fromisoformat(message.get("timestamp", datetime.now().isoformat())).strftime("%H:%M")
-            }
-            
-            processed_data.append(processed_message)
+        try:
+            chunks = await asyncio.gather(*(
+                self._analyze_sentiment_chunk_async(client, semaphore, budget, texts[start:start + batch_size])
+                for start in range(0, len(texts), batch_size)
+            ))
+        finally:
+            await client.close()
+            
+        return [sentiment for chunk in chunks for sentiment in chunk]
+
+    async def _analyze_sentiment_chunk_async(self, client: AsyncOpenAI, semaphore: asyncio.Semaphore,
+                                             budget: _RateLimitBudget, texts: List[str]) -> List[str]:
+        """Асинхронно определяет тональность пакета сообщений одним запросом"""
+        try:
+            content = await self._acomplete_with_retry(client, semaphore, budget, self._sentiment_chunk_request(texts))
+        except Exception as e:
+            self.logger.error(f"Ошибка при пакетном анализе тональности: {str(e)}")
+            return ["Не определено"] * len(texts)
+            
+        if content is None:
+            return ["Не определено"] * len(texts)
+            
+        labels = self._parse_sentiment_labels(content)
+        if len(labels) != len(texts):
+            # Поодиночный разбор идет через тот же клиент, семафор и бюджет лимитов, что и пакеты
+            self.logger.warning(f"Получено {len(labels)} меток тональности вместо {len(texts)}, анализирую по одному")
+            return list(await asyncio.gather(*(
+                self._analyze_sentiment_async(client, semaphore, budget, text) for text in texts
+            )))
+            
+        return self._match_sentiment_labels(texts, labels)
+
+    async def _analyze_sentiment_async(self, client: AsyncOpenAI, semaphore: asyncio.Semaphore,
+                                       budget: _RateLimitBudget, text: str) -> str:
+        """Асинхронный вариант analyze_sentiment"""
+        try:
+            content = await self._acomplete_with_retry(client, semaphore, budget, self._sentiment_request(text))
+        except Exception as e:
+            self.logger.error(f"Ошибка при анализе тональности: {str(e)}")
+            return "Не определено"
+            
+        if content is None:
+            return "Не определено"
+            
+        sentiment = content.strip()
+        return sentiment if sentiment in _SENTIMENTS else "Нейтральная"
+
+    async def _acomplete_with_retry(self, client: AsyncOpenAI, semaphore: asyncio.Semaphore,
+                                    budget: _RateLimitBudget, request: Dict) -> Optional[str]:
+        """Выполняет запрос к OpenAI в пределах лимитов, повторяя его с экспоненциальной задержкой при лимитах
+        и временных сбоях. Возвращает текст ответа или None, если попытки исчерпаны
+        """
+        # Грубая оценка токенов запроса: промпт плюс максимальная длина ответа
+        tokens = sum(len(message["content"]) for message in request["messages"]) // 3 + request["max_tokens"]
         
-        df = pd.DataFrame(processed_data)
+        async with semaphore:
+            for attempt in range(_SENTIMENT_MAX_ATTEMPTS):
+                await budget.acquire(tokens)
+                try:
+                    raw_response = await client.chat.completions.with_raw_response.create(**request)
+                except _SENTIMENT_RETRY_ERRORS as e:
+                    if attempt + 1 < _SENTIMENT_MAX_ATTEMPTS:
+                        delay = min(60, 2 ** attempt) + random.uniform(0, 1)
+                        if isinstance(e, RateLimitError):
+                            self.logger.warning(f"Превышен лимит OpenAI, повтор через {delay:.1f} с")
+                        else:
+                            self.logger.warning(f"Временная ошибка OpenAI ({str(e)}), повтор через {delay:.1f} с")
+                        await asyncio.sleep(delay)
+                    last_error = e
+                    continue
+                    
+                budget.update(raw_response.headers)
+                return raw_response.parse().choices[0].message.content
+                
+        self.logger.error(f"Не удалось проанализировать тональность: попытки запроса к OpenAI исчерпаны ({str(last_error)})")
+        return None
+
+    def analyze_sentiments_via_batch_api(self, texts: List[str], poll_interval: float = 10, max_poll_interval: float = 300) -> List[str]:
+        """Анализирует тональность через OpenAI Batch API: загружает JSONL с запросами и ждет готовности пакета"""
+        sentiments = ["Не определено"] * len(texts)
+        if not self.openai_client or not texts:
+            return sentiments
+            
+        try:
+            lines = [
+                json.dumps({"custom_id": str(i), "method": "POST", "url": "/v1/chat/completions", "body": self._sentiment_request(text)}, ensure_ascii=False)
+                for i, text in enumerate(texts)
+            ]
+            input_file = self.openai_client.files.create(
+                file=("sentiment_batch.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = self.openai_client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            self.logger.info(f"Создан пакет OpenAI {batch.id} на {len(texts)} сообщений")
+            
+            # Опрашиваем статус с растущим интервалом
+            delay = poll_interval
+            while batch.status not in _BATCH_FINAL_STATUSES:
+                time.sleep(delay)
+                delay = min(delay * 2, max_poll_interval)
+                batch = self.openai_client.batches.retrieve(batch.id)
+                
+            if batch.status != "completed":
+                self.logger.error(f"Пакет OpenAI {batch.id} завершился со статусом {batch.status}")
+            if not batch.output_file_id:
+                return sentiments
+                
+            # Даже у просроченного пакета может быть файл с частью результатов
+            output = self.openai_client.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                sentiment = response["body"]["choices"][0]["message"]["content"].strip()
+                sentiments[int(result["custom_id"])] = sentiment if sentiment in _SENTIMENTS else "Нейтральная"
+                
+        except Exception as e:
+            self.logger.error(f"Ошибка при анализе тональности через Batch API: {str(e)}")
+            
+        return sentiments
+
+    def _sentiment_chunk_request(self, texts: List[str]) -> Dict:
+        """Формирует параметры запроса к OpenAI для пакета сообщений"""
+        prompt = "\n".join(f"{i}) {text}" for i, text in enumerate(texts, 1))
         
-        # Добавляем дополнительные аналитические столбцы
-        if not df.empty:
-            df["День недели"] = pd.to_datetime(df["Дата"]).dt.day_name()
-            df["Час"] = pd.to_datetime(df["Время суток"]).dt.hour
+        return {
+            "model": "gpt-3.5-turbo",
+            "messages": [
+                {"role": "system", "content": "Определи тональность каждого сообщения как 'Позитивная', 'Негативная' или 'Нейтральная'. "
+                                              "Ответь списком: по одному слову на строку, в том же порядке, что и сообщения."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": 10 * len(texts),
+            "temperature": 0
+        }
+
+    def _parse_sentiment_labels(self, content: str) -> List[str]:
+        """Разбирает ответ модели на список меток, убирая нумерацию строк"""
+        return [_NUMBERING_RE.sub('', line).strip(' .') for line in content.splitlines() if line.strip()]
+
+    def _match_sentiment_labels(self, texts: List[str], labels: List[str]) -> List[str]:
+        """Сопоставляет метки сообщениям пакета"""
+        if len(labels) != len(texts):
+            # Модель не вернула по метке на сообщение - анализируем по одному
+            self.logger.warning(f"Получено {len(labels)} меток тональности вместо {len(texts)}, анализирую по одному")
+            return [self.analyze_sentiment(text) for text in texts]
             
-        return df
+        return [label if label in _SENTIMENTS else "Нейтральная" for label in labels]
+
+    def process_messages(self, messages: List) -> pd.DataFrame:
+        """Обрабатывает список сообщений и возвращает DataFrame"""
+        if not messages:
+            return pd.DataFrame()
+            
+        # Исходные поля берем одним проходом по сообщениям, а результат собираем по столбцам,
+        # не добавляя промежуточные колонки в исходный DataFrame
+        source = pd.DataFrame.from_records([_source_fields(msg) for msg in messages], columns=list(_SOURCE_COLUMNS))
+        texts = source["text"].fillna("")
+        cleaned = texts.map(self.clean_text)
+        
+        if self.openai_batch_mode:
+            sentiments = self.analyze_sentiments_via_batch_api(cleaned.tolist())
+        else:
+            sentiments = self.analyze_sentiments_parallel(cleaned.tolist())
+            
+        # Сообщения без времени относим к моменту обработки; текущее время берем один раз и только если оно нужно
+        timestamps = pd.to_datetime(source["timestamp"], format="ISO8601", errors="coerce")
+        if timestamps.hasnans:
+            timestamps = timestamps.fillna(pd.Timestamp.now())
+        # Форматируем один раз и режем строку: strftime в pandas выполняется поэлементно
+        formatted = timestamps.dt.strftime("%Y-%m-%d %H:%M")
+        
+        return pd.DataFrame({
+            "ID сообщения": source["message_id"],
+            "Автор": source["author"],
+            "Текст сообщения": cleaned,
+            "Оригинальный текст": texts,
+            "Время": source["timestamp"],
+            "Тип сообщения": source["type"],
+            "Категория": cleaned.map(self.categorize_message),
+            "Ключевые слова": cleaned.map(lambda text: ", ".join(self.extract_keywords(text))),
+            "Тональность": sentiments,
+            "Длина сообщения": cleaned.str.len(),
+            "Дата": formatted.str[:10],
+            "Время суток": formatted.str[11:],
+            # Компактные типы: подсчеты в сводке идут по целочисленным кодам, а не по строкам
+            "День недели": timestamps.dt.day_name().astype("category"),
+            "Час": timestamps.dt.hour.astype("int8")
+        }, copy=False)
 
     def generate_summary(self, df: pd.DataFrame) -> Dict:
         """Генерирует сводную статистику по сообщениям"""
@@ -124,8 +457,8 @@ class DataProcessor:
             "Самые активные авторы": df["Автор"].value_counts().head(5).to_dict(),
             "Популярные категории": df["Категория"].value_counts().to_dict(),
             "Распределение тональности": df["Тональность"].value_counts().to_dict(),
-            "Сообщения по часам": df.groupby("Час").size().to_dict(),
-            "Сообщения по дням недели": df.groupby("День недели").size().to_dict()
+            "Сообщения по часам": df["Час"].value_counts().sort_index().to_dict(),
+            "Сообщения по дням недели": df["День недели"].value_counts().to_dict()
         }
         
         return summary
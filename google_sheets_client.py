@@ -1,4 +1,5 @@
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -82,19 +83,13 @@ class GoogleSheetsClient:
             worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows=len(data) + 1, cols=len(data.columns))
             
             # Записываем данные
-            worksheet.update([data.columns.values.tolist()] + data.values.tolist())
+            self._write_dataframe(worksheet, data)
             
-            # Форматируем заголовки
-            worksheet.format('A1:' + chr(ord('A') + len(data.columns) - 1) + '1', {
-                'textFormat': {'bold': True},
-                'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
-            })
-            
-            # Автоматическая ширина колонок
-            for i, col in enumerate(data.columns):
-                worksheet.format(f'{chr(ord("A") + i)}:{chr(ord("A") + i)}', {
-                    'wrapStrategy': 'WRAP'
-                })
+            # Форматируем заголовки и перенос текста во всех колонках одним запросом
+            spreadsheet.batch_update({'requests': [
+                self._header_format_request(worksheet.id, len(data.columns)),
+                self._wrap_columns_request(worksheet.id, len(data.columns))
+            ]})
             
             self.logger.info(f"Данные успешно записаны в лист '{worksheet_name}'")
             return True
@@ -115,35 +110,25 @@ class GoogleSheetsClient:
             except gspread.WorksheetNotFound:
                 pass
             
-            # Создаем новый лист
-            worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows=50, cols=3)
-            
-            # Подготавливаем данные для записи
-            summary_data = []
-            summary_data.append(["Метрика", "Значение", ""])
-            summary_data.append(["", "", ""])  # Пустая строка
-            
-            for key, value in summary.items():
-                if isinstance(value, dict):
-                    summary_data.append([key, "", ""])
-                    for sub_key, sub_value in value.items():
-                        summary_data.append([f"  {sub_key}", str(sub_value), ""])
-                    summary_data.append(["", "", ""])
-                else:
-                    summary_data.append([key, str(value), ""])
+            # Разворачиваем сводку в строки (метрика, ключ, значение); у скалярных метрик ключ пустой
+            rows = [
+                (metric, sub_key, sub_value)
+                for metric, value in summary.items()
+                for sub_key, sub_value in (value.items() if isinstance(value, dict) else [("", value)])
+            ]
             
             # Добавляем информацию о времени обновления
-            summary_data.append(["", "", ""])
-            summary_data.append(["Последнее обновление", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), ""])
+            rows.append(("Последнее обновление", "", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            summary_df = pd.DataFrame(rows, columns=["Метрика", "Ключ", "Значение"])
+            
+            # Создаем новый лист
+            worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows=len(summary_df) + 1, cols=len(summary_df.columns))
             
             # Записываем данные
-            worksheet.update(summary_data)
+            self._write_dataframe(worksheet, summary_df)
             
             # Форматируем
-            worksheet.format('A1:B1', {
-                'textFormat': {'bold': True},
-                'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
-            })
+            spreadsheet.batch_update({'requests': [self._header_format_request(worksheet.id, len(summary_df.columns))]})
             
             self.logger.info(f"Сводка успешно записана в лист '{worksheet_name}'")
             return True
@@ -164,7 +149,7 @@ class GoogleSheetsClient:
                 return self.write_data_to_sheet(spreadsheet_id, data, worksheet_name)
             
             # Добавляем данные в конец
-            worksheet.append_rows(data.values.tolist())
+            worksheet.append_rows(self._dataframe_values(data))
             
             self.logger.info(f"Добавлено {len(data)} новых сообщений в лист '{worksheet_name}'")
             return True
@@ -173,6 +158,42 @@ class GoogleSheetsClient:
             self.logger.error(f"Ошибка при добавлении данных: {str(e)}")
             return False
 
+    def _write_dataframe(self, worksheet: gspread.Worksheet, data: pd.DataFrame):
+        """Записывает DataFrame с заголовками одним запросом без разбора формул на стороне Sheets"""
+        worksheet.update(
+            values=[data.columns.tolist()] + self._dataframe_values(data),
+            range_name=f'A1:{rowcol_to_a1(len(data) + 1, len(data.columns))}',
+            value_input_option='RAW'
+        )
+
+    def _dataframe_values(self, data: pd.DataFrame) -> List[List]:
+        """Преобразует DataFrame в строки для Sheets API за один проход: числа остаются числами, пропуски - пустыми ячейками"""
+        values = data.astype(object)
+        return values.where(data.notna(), "").values.tolist()
+
+    def _header_format_request(self, sheet_id: int, column_count: int) -> Dict:
+        """Запрос batch_update: жирный шрифт и серый фон для строки заголовков"""
+        return {
+            'repeatCell': {
+                'range': {'sheetId': sheet_id, 'startRowIndex': 0, 'endRowIndex': 1, 'startColumnIndex': 0, 'endColumnIndex': column_count},
+                'cell': {'userEnteredFormat': {
+                    'textFormat': {'bold': True},
+                    'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
+                }},
+                'fields': 'userEnteredFormat(textFormat,backgroundColor)'
+            }
+        }
+
+    def _wrap_columns_request(self, sheet_id: int, column_count: int) -> Dict:
+        """Запрос batch_update: перенос текста сразу во всех колонках с данными"""
+        return {
+            'repeatCell': {
+                'range': {'sheetId': sheet_id, 'startColumnIndex': 0, 'endColumnIndex': column_count},
+                'cell': {'userEnteredFormat': {'wrapStrategy': 'WRAP'}},
+                'fields': 'userEnteredFormat.wrapStrategy'
+            }
+        }
+
     def get_spreadsheet_url(self, spreadsheet_id: str) -> str:
         """Получает URL таблицы"""
         return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}"
@@ -71,9 +71,9 @@ def setup_groups():
                 print(f"✅ Успешно получено {len(messages)} сообщений")
                 print("\nПример сообщения:")
                 sample = client.process_message(messages[0])
-                print(f"   Автор: {sample['author']}")
-                print(f"   Текст: {sample['text'][:100]}...")
-                print(f"   Время: {sample['timestamp']}")
+                print(f"   Автор: {sample.author}")
+                print(f"   Текст: {sample.text[:100]}...")
+                print(f"   Время: {sample.timestamp}")
             else:
                 print("❌ Не удалось получить сообщения")
         
@@ -101,7 +101,7 @@ def test_specific_group(group_id):
             authors = {}
             for msg in messages:
                 processed = client.process_message(msg)
-                author = processed['author']
+                author = processed.author
                 authors[author] = authors.get(author, 0) + 1
             
             print("\n📊 Активность авторов:")
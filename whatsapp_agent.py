@@ -4,10 +4,12 @@ WhatsApp AI Agent для сбора и анализа сообщений из г
 """
 
 import os
+import json
 import logging
 import schedule
 import time
 from datetime import datetime, timedelta
+from typing import Iterable, Set
 from dotenv import load_dotenv
 from whatsapp_client import WhatsAppClient
 from data_processor import DataProcessor
@@ -37,7 +39,8 @@ class WhatsAppAgent:
         )
         
         self.data_processor = DataProcessor(
-            openai_api_key=os.getenv('OPENAI_API_KEY')
+            openai_api_key=os.getenv('OPENAI_API_KEY'),
+            openai_batch_mode=os.getenv('OPENAI_BATCH_MODE', 'false').lower() == 'true'
         )
         
         self.google_sheets_client = GoogleSheetsClient(
@@ -53,6 +56,9 @@ class WhatsAppAgent:
         
         # ID таблицы Google Sheets
         self.spreadsheet_id = None
+        
+        # ID сообщений, уже записанных в таблицу (чтобы не анализировать их повторно)
+        self.seen_ids_file = 'seen_ids.json'
 
     def setup_spreadsheet(self):
         """Настраивает Google Таблицу"""
@@ -90,11 +96,13 @@ class WhatsAppAgent:
             # Записываем в Google Sheets
             if self.spreadsheet_id:
                 # Обновляем основной лист с сообщениями
-                self.google_sheets_client.write_data_to_sheet(
+                if self.google_sheets_client.write_data_to_sheet(
                     self.spreadsheet_id, 
                     processed_df, 
                     "Сообщения"
-                )
+                ):
+                    # Лист перезаписан целиком - в нем ровно эти сообщения
+                    self._save_seen_ids(msg.message_id for msg in all_messages)
                 
                 # Обновляем лист со сводкой
                 self.google_sheets_client.write_summary_to_sheet(
@@ -127,17 +135,19 @@ class WhatsAppAgent:
                 with open(last_run_file, 'r') as f:
                     last_timestamp = f.read().strip()
             
+            seen_ids = self._load_seen_ids()
+            
             # Собираем сообщения
             all_messages = self.whatsapp_client.get_messages_from_multiple_groups(
                 self.group_ids, 
                 self.messages_per_group
             )
             
-            # Фильтруем только новые сообщения
-            if last_timestamp:
-                new_messages = [msg for msg in all_messages if msg.get('timestamp', '') > last_timestamp]
-            else:
-                new_messages = all_messages
+            # Фильтруем только новые сообщения до анализа: уже записанные в таблицу не обрабатываем повторно
+            new_messages = [
+                msg for msg in all_messages
+                if (not last_timestamp or msg.timestamp > last_timestamp) and msg.message_id not in seen_ids
+            ]
             
             if new_messages:
                 # Обрабатываем новые сообщения
@@ -145,11 +155,16 @@ class WhatsAppAgent:
                 
                 # Добавляем в таблицу
                 if self.spreadsheet_id:
-                    self.google_sheets_client.append_data_to_sheet(
+                    if self.google_sheets_client.append_data_to_sheet(
                         self.spreadsheet_id, 
                         processed_df, 
                         "Сообщения"
-                    )
+                    ):
+                        # Вернуться могут только ID из текущей выборки, поэтому храним лишь их, а не растущее объединение
+                        self._save_seen_ids(
+                            {msg.message_id for msg in all_messages if msg.message_id in seen_ids}
+                            | {msg.message_id for msg in new_messages}
+                        )
                 
                 self.logger.info(f"Добавлено {len(new_messages)} новых сообщений")
             
@@ -160,6 +175,19 @@ class WhatsAppAgent:
         except Exception as e:
             self.logger.error(f"Ошибка при получении новых сообщений: {str(e)}")
 
+    def _load_seen_ids(self) -> Set[str]:
+        """Загружает ID сообщений, уже записанных в таблицу"""
+        if not os.path.exists(self.seen_ids_file):
+            return set()
+            
+        with open(self.seen_ids_file, 'r') as f:
+            return set(json.load(f))
+
+    def _save_seen_ids(self, message_ids: Iterable[str]):
+        """Сохраняет ID сообщений, уже записанных в таблицу"""
+        with open(self.seen_ids_file, 'w') as f:
+            json.dump(sorted(mid for mid in message_ids if mid is not None), f)
+
     def run_once(self):
         """Запускает агент один раз"""
         self.logger.info("Запуск WhatsApp агента (однократный режим)")
@@ -1,104 +1,587 @@
+import asyncio
+import heapq
+from itertools import islice
+import os
+import httpx
+import ijson
+import numpy as np
 import requests
+import urllib3
+from aiolimiter import AsyncLimiter
+from requests.adapters import HTTPAdapter
 import json
+import random
 import time
-from datetime import datetime
-from typing import List, Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
 import logging
+from operator import attrgetter
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# urllib3 и httpx распаковывают brotli только при установленном пакете brotli,
+# поэтому br просим у сервера, лишь когда сможем его разобрать
+try:
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    _ACCEPT_ENCODING = "gzip, deflate"
+
+# Коды ответа, после которых запрос имеет смысл повторить
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_MAX_RETRY_DELAY = 60
+_GROUPS_CACHE_TTL = 60
+# Поля сообщений, которые запрашиваем у Graph API
+_MESSAGE_FIELDS = "id,from,to,text,timestamp,author,type"
+_CONVERSATION_FIELDS = "id,name,participants,is_group"
+# Graph API принимает не больше 50 подзапросов в одном batch-запросе
+_GRAPH_BATCH_SIZE = 50
+# Общая заглушка для сообщений без поля text; никогда не изменяется
+_EMPTY: Dict = {}
+# Сколько ответов с ETag держим в памяти
+_ETAG_CACHE_SIZE = 256
+# С какого объема выборки сообщения обрабатываются в пуле процессов, а не в event loop
+_PROCESS_POOL_THRESHOLD = 2000
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After: число секунд или HTTP-дата"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class _TokenBucket:
+    """Ограничитель частоты синхронных запросов: до capacity запросов подряд, дальше rate в секунду"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+
+    def acquire(self):
+        """Забирает один токен, ожидая только если они закончились"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) / self.rate)
+            # Время ожидания уже ушло на недостающий токен
+            self.last = time.monotonic()
+            self.tokens = 0.0
+        else:
+            self.tokens -= 1
+
+@dataclass
+class Message:
+    """Обработанное сообщение WhatsApp; __slots__ вместо словаря экономит память на больших выборках"""
+    __slots__ = ("message_id", "author", "text", "timestamp", "timestamp_epoch", "type", "from_phone", "to_phone")
+    
+    message_id: Optional[str]
+    author: str
+    text: str
+    timestamp: str
+    timestamp_epoch: int
+    type: str
+    from_phone: Optional[str]
+    to_phone: Optional[str]
+
+    def to_tuple(self) -> Tuple:
+        """Возвращает значения полей в порядке __slots__ (см. Message.__slots__)"""
+        return _message_values(self)
+
+    def to_dict(self) -> Dict:
+        """Возвращает сообщение в виде словаря, например для сериализации в JSON"""
+        # dataclasses.asdict рекурсивно копирует значения, а поля здесь - только скаляры
+        return dict(zip(self.__slots__, _message_values(self)))
+
+_message_values = attrgetter(*Message.__slots__)
+
+def _process_messages_batch(messages: List[Dict]) -> List[Message]:
+    """Обрабатывает пачку сообщений, переводя время в ISO формат одним векторным проходом"""
+    if not messages:
+        return []
+    
+    epochs = np.fromiter((int(msg.get("timestamp") or 0) for msg in messages),
+                         dtype=np.int64, count=len(messages))
+    
+    # fromtimestamp возвращает локальное время: смещение от UTC берем одно на сутки,
+    # а для суток с переходом на летнее время считаем его для каждого сообщения
+    days, day_index = np.unique(epochs // 86400, return_inverse=True)
+    day_starts = days * 86400
+    start_offsets = np.array([time.localtime(ts).tm_gmtoff for ts in day_starts.tolist()], dtype=np.int64)
+    end_offsets = np.array([time.localtime(ts + 86399).tm_gmtoff for ts in day_starts.tolist()], dtype=np.int64)
+    
+    offsets = start_offsets[day_index]
+    shifted = (start_offsets != end_offsets)[day_index]
+    if shifted.any():
+        offsets[shifted] = [time.localtime(ts).tm_gmtoff for ts in epochs[shifted].tolist()]
+    
+    local = epochs + offsets
+    timestamps = local.astype("datetime64[s]").astype(str).tolist()
+    
+    return [
+        Message(
+            message_id=msg.get("id"),
+            author=msg.get("author", "Unknown"),
+            text=(msg.get("text") or _EMPTY).get("body", ""),
+            timestamp=timestamp,
+            timestamp_epoch=epoch,
+            type=msg.get("type", "text"),
+            from_phone=msg.get("from"),
+            to_phone=msg.get("to")
+        )
+        for msg, timestamp, epoch in zip(messages, timestamps, epochs.tolist())
+    ]
 
 class WhatsAppClient:
     def __init__(self, api_token: str, phone_number_id: str):
         self.api_token = api_token
         self.phone_number_id = phone_number_id
         self.base_url = "https://graph.facebook.com/v18.0"
+        # Адреса и параметры запросов не меняются между вызовами, поэтому собираем их один раз
+        self._messages_url_tmpl = self.base_url + "/{group_id}/messages"
+        self._conversations_url = self.base_url + "/me/conversations"
+        self._batch_url = self.base_url + "/"
+        self._conversations_params = {"fields": _CONVERSATION_FIELDS, "limit": 50}
         self.headers = {
             "Authorization": f"Bearer {api_token}",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": _ACCEPT_ENCODING
         }
         self.logger = logging.getLogger(__name__)
+        
+        # Одна сессия на клиента: TCP/TLS соединения с Graph API переиспользуются между запросами
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            # Адаптер не повторяет запросы: и сетевые сбои, и 429/5xx повторяют _get_with_retry и _stream_page,
+            # иначе попытки перемножаются
+            max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        
+        # Список групп меняется редко, поэтому держим его в памяти _GROUPS_CACHE_TTL секунд
+        self._groups_cache: Optional[List[Dict]] = None
+        self._groups_cache_ts = 0.0
+        
+        # Те же 5 запросов в секунду, что и в асинхронном пути, но с запасом на короткие всплески
+        self._limiter = _TokenBucket(rate=5, capacity=10)
+        
+        # ETag и разобранный ответ по каждому запросу: при 304 тело не скачивается и не разбирается
+        self._etag_cache: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Закрывает HTTP-сессию и ее пул соединений"""
+        self.session.close()
+
+    def refresh_groups(self):
+        """Сбрасывает кэш списка групп: следующий get_groups_list запросит его заново"""
+        self._groups_cache_ts = 0.0
+
+    def _retry_delay(self, attempt: int, status: Optional[int], headers) -> float:
+        """Задержка перед повтором: Retry-After от сервера или экспоненциальная с джиттером"""
+        if status == 429:
+            # Заголовки с использованием квоты помогают понять, какой лимит исчерпан
+            usage = headers.get("X-Business-Use-Case-Usage") or headers.get("X-App-Usage")
+            if usage:
+                self.logger.warning(f"Превышен лимит Graph API: {usage}")
+                
+        retry_after = _parse_retry_after(headers.get("Retry-After"))
+        if retry_after is not None:
+            return min(retry_after, _MAX_RETRY_DELAY)
+            
+        return min(0.3 * 2 ** attempt + random.uniform(0, 0.3), _MAX_RETRY_DELAY)
+
+    def _get_with_retry(self, url: str, params: Optional[Dict] = None, max_attempts: int = 4) -> Optional[Dict]:
+        """Выполняет GET-запрос к Graph API, повторяя его при 429/5xx и сетевых сбоях.
+        
+        Если для запроса известен ETag, запрос условный: на 304 возвращается ранее полученный ответ
+        """
+        cache_key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+        cached = self._etag_cache.get(cache_key)
+        conditional = {"If-None-Match": cached[0]} if cached else None
+        
+        for attempt in range(max_attempts):
+            status, headers = None, {}
+            try:
+                self._limiter.acquire()
+                response = self.session.get(url, params=params, headers=conditional, timeout=(3.05, 15))
+                status, headers = response.status_code, response.headers
+                
+                if status == 304 and cached:
+                    self._etag_cache.move_to_end(cache_key)
+                    return cached[1]
+                if status == 200:
+                    data = _loads(response.content)
+                    self._remember_etag(cache_key, headers.get("ETag"), data)
+                    return data
+                if status not in _RETRY_STATUSES:
+                    self.logger.error(f"Ошибка запроса к {url}: {status} - {response.text}")
+                    return None
+                    
+            except requests.RequestException as e:
+                self.logger.warning(f"Сетевая ошибка при запросе к {url}: {str(e)}")
+                
+            if attempt + 1 < max_attempts:
+                time.sleep(self._retry_delay(attempt, status, headers))
+                
+        self.logger.error(f"Запрос к {url} не удался после {max_attempts} попыток (последний статус: {status})")
+        return None
+
+    def _remember_etag(self, cache_key: str, etag: Optional[str], data: Dict):
+        """Запоминает ответ вместе с его ETag; самые давно использованные записи вытесняются"""
+        if not etag:
+            self._etag_cache.pop(cache_key, None)
+            return
+            
+        self._etag_cache[cache_key] = (etag, data)
+        self._etag_cache.move_to_end(cache_key)
+        while len(self._etag_cache) > _ETAG_CACHE_SIZE:
+            self._etag_cache.popitem(last=False)
+
+    async def _aget_with_retry(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, limiter: AsyncLimiter,
+                               url: str, params: Optional[Dict] = None, max_attempts: int = 4) -> Optional[Dict]:
+        """Асинхронный вариант _get_with_retry: ожидание между попытками не блокирует event loop"""
+        for attempt in range(max_attempts):
+            status, headers = None, {}
+            try:
+                async with semaphore, limiter:
+                    response = await client.get(url, params=params)
+                status, headers = response.status_code, response.headers
+                
+                if status == 200:
+                    return _loads(response.content)
+                if status not in _RETRY_STATUSES:
+                    self.logger.error(f"Ошибка запроса к {url}: {status} - {response.text}")
+                    return None
+                    
+            except httpx.HTTPError as e:
+                self.logger.warning(f"Сетевая ошибка при запросе к {url}: {str(e)}")
+                
+            if attempt + 1 < max_attempts:
+                await asyncio.sleep(self._retry_delay(attempt, status, headers))
+                
+        self.logger.error(f"Запрос к {url} не удался после {max_attempts} попыток (последний статус: {status})")
+        return None
 
     def get_group_messages(self, group_id: str, limit: int = 100) -> List[Dict]:
         """Получает сообщения из WhatsApp группы"""
         messages = []
         
         try:
-            url = f"{self.base_url}/{group_id}/messages"
-            params = {
-                "limit": limit,
-                "fields": "id,from,to,text,timestamp,author,type"
-            }
-            
-            response = requests.get(url, headers=self.headers, params=params)
+            url = self._messages_url_tmpl.format(group_id=group_id)
+            data = self._get_with_retry(url, {"limit": limit, "fields": _MESSAGE_FIELDS})
             
-            if response.status_code == 200:
-                data = response.json()
-                messages = data.get("data", [])
+            if data is not None:
+                # Ответ может лежать в кэше ETag, поэтому пополняем копию, а не сам список
+                messages = list(data.get("data", []))
+                
+                # Graph API отдает сообщения страницами: идем по курсору, пока не наберем limit
+                next_url = data.get("paging", {}).get("next")
+                while next_url and len(messages) < limit:
+                    # В ссылке next уже есть все параметры запроса
+                    data = self._get_with_retry(next_url)
+                    if data is None:
+                        break
+                    messages.extend(data.get("data", []))
+                    next_url = data.get("paging", {}).get("next")
+                    
+                messages = messages[:limit]
                 self.logger.info(f"Получено {len(messages)} сообщений из группы {group_id}")
-            else:
-                self.logger.error(f"Ошибка при получении сообщений: {response.status_code} - {response.text}")
                 
         except Exception as e:
             self.logger.error(f"Исключение при получении сообщений: {str(e)}")
             
         return messages
 
+    def stream_group_messages(self, group_id: str, limit: int = 100) -> Iterator[Dict]:
+        """Отдает сообщения группы по одному, разбирая JSON по мере загрузки ответа"""
+        url = self._messages_url_tmpl.format(group_id=group_id)
+        params = {"limit": limit, "fields": _MESSAGE_FIELDS}
+        
+        remaining = limit
+        while url and remaining > 0:
+            paging = {}
+            for msg in self._stream_page(url, params, paging):
+                yield msg
+                remaining -= 1
+                if remaining <= 0:
+                    return
+                    
+            # В ссылке next уже есть все параметры запроса
+            url, params = paging.get("next"), None
+
+    def _stream_page(self, url: str, params: Optional[Dict], paging: Dict, max_attempts: int = 4) -> Iterator[Dict]:
+        """Потоково разбирает одну страницу ответа; ссылку на следующую страницу кладет в paging["next"]"""
+        for attempt in range(max_attempts):
+            status, headers = None, {}
+            started = False
+            try:
+                self._limiter.acquire()
+                with self.session.get(url, params=params, stream=True, timeout=(3.05, 15)) as response:
+                    status, headers = response.status_code, response.headers
+                    
+                    if status == 200:
+                        # raw отдает тело как есть, поэтому gzip распаковываем явно
+                        response.raw.decode_content = True
+                        for msg in self._parse_page(response.raw, paging):
+                            started = True
+                            yield msg
+                        return
+                    if status not in _RETRY_STATUSES:
+                        self.logger.error(f"Ошибка запроса к {url}: {status} - {response.text}")
+                        return
+                        
+            # Тело читается напрямую из response.raw, поэтому обрыв приходит исключением urllib3, а не requests
+            except (requests.RequestException, urllib3.exceptions.HTTPError, ijson.JSONError) as e:
+                # Повтор после частично отданной страницы продублировал бы сообщения
+                if started:
+                    self.logger.error(f"Обрыв ответа {url}: {str(e)}")
+                    return
+                self.logger.warning(f"Сетевая ошибка при запросе к {url}: {str(e)}")
+                
+            if attempt + 1 < max_attempts:
+                time.sleep(self._retry_delay(attempt, status, headers))
+                
+        self.logger.error(f"Запрос к {url} не удался после {max_attempts} попыток (последний статус: {status})")
+
+    @staticmethod
+    def _parse_page(stream, paging: Dict) -> Iterator[Dict]:
+        """Собирает элементы data из потока событий ijson, не держа страницу целиком в памяти"""
+        builder = None
+        for prefix, event, value in ijson.parse(stream, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == "data.item" and event == "end_map":
+                    yield builder.value
+                    builder = None
+            elif prefix == "data.item" and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix == "paging.next" and event == "string":
+                paging["next"] = value
+
     def get_groups_list(self) -> List[Dict]:
         """Получает список групп WhatsApp"""
+        if self._groups_cache is not None and time.monotonic() - self._groups_cache_ts < _GROUPS_CACHE_TTL:
+            return list(self._groups_cache)
+            
         groups = []
         
         try:
-            url = f"{self.base_url}/me/conversations"
-            params = {
-                "fields": "id,name,participants,is_group",
-                "limit": 50
-            }
-            
-            response = requests.get(url, headers=self.headers, params=params)
+            data = self._get_with_retry(self._conversations_url, self._conversations_params)
             
-            if response.status_code == 200:
-                data = response.json()
+            if data is not None:
                 conversations = data.get("data", [])
                 groups = [conv for conv in conversations if conv.get("is_group", False)]
                 self.logger.info(f"Найдено {len(groups)} групп")
-            else:
-                self.logger.error(f"Ошибка при получении групп: {response.status_code} - {response.text}")
+                
+                self._groups_cache = groups
+                self._groups_cache_ts = time.monotonic()
+                groups = list(groups)
                 
         except Exception as e:
             self.logger.error(f"Исключение при получении групп: {str(e)}")
             
         return groups
 
-    def process_message(self, message: Dict) -> Dict:
+    def process_message(self, message: Dict) -> Message:
         """Обрабатывает и структурирует сообщение"""
-        processed = {
-            "message_id": message.get("id"),
-            "author": message.get("author", "Unknown"),
-            "text": message.get("text", {}).get("body", ""),
-            "timestamp": datetime.fromtimestamp(int(message.get("timestamp", 0))).isoformat(),
-            "type": message.get("type", "text"),
-            "from_phone": message.get("from"),
-            "to_phone": message.get("to")
-        }
+        get = message.get
+        epoch = int(get("timestamp") or 0)
+        return Message(
+            message_id=get("id"),
+            author=get("author", "Unknown"),
+            text=(get("text") or _EMPTY).get("body", ""),
+            timestamp=datetime.fromtimestamp(epoch).isoformat(),
+            timestamp_epoch=epoch,
+            type=get("type", "text"),
+            from_phone=get("from"),
+            to_phone=get("to")
+        )
+
+    def process_messages(self, messages: List[Dict]) -> List[Message]:
+        """Обрабатывает пачку сообщений, переводя время в ISO формат одним векторным проходом"""
+        return _process_messages_batch(messages)
+
+    async def aget_group_messages_paged(self, client: httpx.AsyncClient, group_id: str, limit: int = 100,
+                                        semaphore: Optional[asyncio.Semaphore] = None,
+                                        limiter: Optional[AsyncLimiter] = None,
+                                        first_response: Optional[Dict] = None) -> AsyncIterator[List[Dict]]:
+        """Асинхронно отдает сообщения группы постранично, по мере загрузки страниц, но не больше limit.
+        
+        first_response - уже полученная первая страница (например, из batch-запроса)
+        """
+        semaphore = semaphore or asyncio.Semaphore(10)
+        limiter = limiter or AsyncLimiter(max_rate=5, time_period=1)
+        
+        data = first_response
+        if data is None:
+            url = self._messages_url_tmpl.format(group_id=group_id)
+            data = await self._aget_with_retry(client, semaphore, limiter, url, {"limit": limit, "fields": _MESSAGE_FIELDS})
+            
+        remaining = limit
+        while data is not None and remaining > 0:
+            page = data.get("data", [])[:remaining]
+            remaining -= len(page)
+            yield page
+            
+            # В ссылке next уже есть все параметры запроса
+            next_url = data.get("paging", {}).get("next")
+            if not next_url or remaining <= 0:
+                return
+            data = await self._aget_with_retry(client, semaphore, limiter, next_url)
+
+    async def _aget_group_messages(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                                   limiter: AsyncLimiter, group_id: str, limit: int, process: bool = True,
+                                   first_response: Optional[Dict] = None) -> List:
+        """Асинхронно получает и обрабатывает сообщения из WhatsApp группы"""
+        messages = []
         
-        return processed
+        try:
+            # Каждую страницу обрабатываем сразу, пока остальные группы ждут ответа сети
+            pages = self.aget_group_messages_paged(client, group_id, limit, semaphore, limiter, first_response)
+            async for page in pages:
+                messages.extend(self.process_messages(page) if process else page)
+                
+            self.logger.info(f"Получено {len(messages)} сообщений из группы {group_id}")
+            
+        except Exception as e:
+            self.logger.error(f"Ошибка при обработке группы {group_id}: {str(e)}")
+            
+        return messages
 
-    def get_messages_from_multiple_groups(self, group_ids: List[str], messages_per_group: int = 50) -> List[Dict]:
-        """Собирает сообщения из нескольких групп"""
-        all_messages = []
+    async def _abatch_first_pages(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, limiter: AsyncLimiter,
+                                  group_ids: List[str], limit: int) -> Dict[str, Dict]:
+        """Запрашивает первые страницы сообщений групп batch-запросами Graph API (до 50 групп в запросе)"""
+        chunks = [group_ids[i:i + _GRAPH_BATCH_SIZE] for i in range(0, len(group_ids), _GRAPH_BATCH_SIZE)]
+        query = urlencode({"limit": limit, "fields": _MESSAGE_FIELDS})
         
-        for group_id in group_ids:
+        async def fetch_chunk(chunk: List[str]) -> Dict[str, Dict]:
+            batch = [{"method": "GET", "relative_url": f"{group_id}/messages?{query}"} for group_id in chunk]
             try:
-                messages = self.get_group_messages(group_id, messages_per_group)
-                processed_messages = [self.process_message(msg) for msg in messages]
-                all_messages.extend(processed_messages)
+                async with semaphore, limiter:
+                    response = await client.post(
+                        self._batch_url,
+                        data={"batch": json.dumps(batch), "include_headers": "false"},
+                        headers={"Content-Type": "application/x-www-form-urlencoded"}
+                    )
+                if response.status_code != 200:
+                    self.logger.warning(f"Batch-запрос не выполнен: {response.status_code} - {response.text}")
+                    return {}
+                    
+                pages = {}
+                # На каждый подзапрос приходит {code, body}; вместо подзапросов, не успевших выполниться, - null
+                for group_id, item in zip(chunk, _loads(response.content)):
+                    if item and item.get("code") == 200:
+                        pages[group_id] = _loads(item["body"])
+                return pages
                 
-                # Небольшая задержка между запросами
-                time.sleep(1)
+            except (httpx.HTTPError, ValueError, TypeError, AttributeError) as e:
+                self.logger.warning(f"Ошибка batch-запроса: {str(e)}")
+                return {}
                 
-            except Exception as e:
-                self.logger.error(f"Ошибка при обработке группы {group_id}: {str(e)}")
-                continue
+        first_pages = {}
+        for pages in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+            first_pages.update(pages)
+        return first_pages
+
+    async def _afetch_groups(self, group_ids: List[str], messages_per_group: int) -> List[List[Message]]:
+        """Одновременно загружает сообщения групп, возвращает отдельный список на каждую группу"""
+        # Не больше 10 запросов одновременно и 5 запросов в секунду
+        semaphore = asyncio.Semaphore(10)
+        limiter = AsyncLimiter(max_rate=5, time_period=1)
+        # HTTP/2 мультиплексирует запросы ко всем группам поверх одного TLS-соединения
+        limits = httpx.Limits(max_keepalive_connections=8, max_connections=32, keepalive_expiry=75)
+        timeout = httpx.Timeout(15.0, connect=3.05)
+        
+        # Большие выборки (например, при догрузке истории) обрабатываем в отдельных процессах,
+        # чтобы не упираться в GIL; на маленьких пересылка данных между процессами дороже
+        workers = min(os.cpu_count() or 1, len(group_ids))
+        in_pool = workers > 1 and len(group_ids) * messages_per_group > _PROCESS_POOL_THRESHOLD
+        
+        async with httpx.AsyncClient(http2=True, headers=self.headers, limits=limits, timeout=timeout) as client:
+            # Первые страницы всех групп берем batch-запросами; группы, для которых batch не сработал,
+            # и следующие страницы загружаются обычными GET-запросами
+            first_pages = {}
+            if len(group_ids) > 1:
+                first_pages = await self._abatch_first_pages(client, semaphore, limiter, group_ids, messages_per_group)
                 
-        # Сортируем по времени
-        all_messages.sort(key=lambda x: x["timestamp"], reverse=True)
+            results = await asyncio.gather(*(
+                self._aget_group_messages(client, semaphore, limiter, group_id, messages_per_group,
+                                          process=not in_pool, first_response=first_pages.get(group_id))
+                for group_id in group_ids
+            ))
+            
+        if in_pool:
+            loop = asyncio.get_running_loop()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(executor, _process_messages_batch, messages)
+                    for messages in results
+                ))
+                
+        return results
+
+    def _merge_group_messages(self, results: List[List[Message]]) -> Iterator[Message]:
+        """Сливает сообщения групп в один поток от новых к старым без общей сортировки"""
+        by_time = attrgetter("timestamp_epoch")
+        for messages in results:
+            # Graph API отдает сообщения от новых к старым, так что сортировка здесь почти бесплатна
+            messages.sort(key=by_time, reverse=True)
+            
+        # Одно и то же сообщение может прийти из нескольких общих групп: оставляем первое
+        seen = set()
+        for msg in heapq.merge(*results, key=by_time, reverse=True):
+            message_id = msg.message_id
+            if message_id is not None:
+                if message_id in seen:
+                    continue
+                seen.add(message_id)
+            yield msg
+
+    async def aget_messages_from_multiple_groups(self, group_ids: List[str], messages_per_group: int = 50,
+                                                 top_k: Optional[int] = None) -> List[Message]:
+        """Асинхронно собирает сообщения из нескольких групп, опрашивая их одновременно.
         
-        return all_messages
+        top_k - вернуть только top_k самых новых сообщений
+        """
+        results = await self._afetch_groups(group_ids, messages_per_group)
+        # Поток уже упорядочен от новых к старым, поэтому top_k - просто его начало
+        return list(islice(self._merge_group_messages(results), top_k))
+
+    def iter_messages_from_multiple_groups(self, group_ids: List[str], messages_per_group: int = 50) -> Iterator[Message]:
+        """Отдает сообщения из нескольких групп по одному, от новых к старым"""
+        results = asyncio.run(self._afetch_groups(group_ids, messages_per_group))
+        yield from self._merge_group_messages(results)
+
+    def get_messages_from_multiple_groups(self, group_ids: List[str], messages_per_group: int = 50,
+                                          top_k: Optional[int] = None) -> List[Message]:
+        """Собирает сообщения из нескольких групп; top_k - вернуть только top_k самых новых"""
+        return list(islice(self.iter_messages_from_multiple_groups(group_ids, messages_per_group), top_k))